@@ -1,46 +1,53 @@
-from re import findall
+import re
 from glob import glob
+from os.path import splitext
 import sys
 
+_THRPT_RE = re.compile(rb'thrpt:  \[\d+\.\d+ Kelem/s (\d+\.\d+) Kelem/s \d+\.\d+ Kelem/s\]')
+_TOTAL_RE = re.compile(rb'total: (\d+\.?\d*)')
+_COMMIT_RE = re.compile(rb'commit: (\d+\.?\d*)')
+
 
 def _parse_throughput(log):
-    tmp = findall(r'thrpt:  \[\d+\.\d+ Kelem/s (\d+\.\d+) Kelem/s \d+\.\d+ Kelem/s\]', log)
+    tmp = _THRPT_RE.findall(log)
     
-    return [float(tps) for tps in tmp]
+    return list(map(float, tmp))
 
 def _parse_latency(log):
-    tmp = findall(r'total: (\d+\.?\d*)', log)
-    total = [float(t) for t in tmp]
+    # cheap substring check skips the regex scans on logs without latencies
+    if b'total: ' not in log:
+        return [], []
+    
+    tmp = _TOTAL_RE.findall(log)
+    total = list(map(float, tmp))
     
-    tmp = findall(r'commit: (\d+\.?\d*)', log)
-    commit = [float(c) for c in tmp]
+    tmp = _COMMIT_RE.findall(log)
+    commit = list(map(float, tmp))
         
     return total, commit
 
 def result(log):
     
     total = _parse_throughput(log)
-    result = "[Throughput (ktps)]\n"
-    for ktps in total:
-        result += f"{ktps} \n"
+    parts = ["[Throughput (ktps)]\n"]
+    parts.extend(f"{ktps} \n" for ktps in total)
         
     if latency:= _parse_latency(log):
         total, commit = latency
-        result += "\n[latency]\n"
-        for t, c in zip(total, commit, strict=True):
-            result += f"{t} {c}\n"
+        parts.append("\n[latency]\n")
+        parts.extend(f"{t} {c}\n" for t, c in zip(total, commit, strict=True))
         
-    return result
+    return "".join(parts)
 
 def process(target_file):
     assert isinstance(target_file, str)
     
     for filename in sorted(glob(target_file)):
-        log = ""
-        with open(filename, 'r') as f:
+        log = b""
+        with open(filename, 'rb') as f:
             log = f.read()
     
-        with open(filename.split()[0]+".out", 'a') as f:
+        with open(splitext(filename)[0] + ".out", 'a', buffering=1 << 16) as f:
             f.write(result(log))
             
 if __name__ == "__main__":
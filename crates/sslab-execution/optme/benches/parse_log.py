@@ -1,117 +1,116 @@
-from re import findall
+import re
 from glob import glob
+from os.path import splitext
 import sys
 
+# one alternation for all scheduling steps; the matched group names the step
+_SCHEDULING_RE = re.compile(
+    rb'ACG construct: (?P<construct>\d+\.\d+)'
+    rb'|Hierachical sort: (?P<sort>\d+\.\d+)'
+    rb'|Reorder: (?P<reorder>\d+\.\d+)'
+    rb'|Extract schedule: (?P<extraction>\d+\.\d+)'
+)
+_THRPT_RE = re.compile(rb'thrpt:  \[\d+\.\d+ Kelem/s (\d+\.\d+) Kelem/s \d+\.\d+ Kelem/s\]')
+_KTPS_RE = re.compile(rb'Ktps: (\d+\.\d+)')
+_LATENCY_RE = re.compile(rb'Total: \d+\.\d+, Simulation: (\d+\.\d+), Scheduling: (\d+\.\d+), V_exec: (\d+\.\d+), V_val: (\d+\.\d+), Commit: (\d+\.\d+), Other: (\d+\.\d+)')
+_TX_LATENCY_RE = re.compile(rb'TX latency: (\d+\.\d+)')
+_BLOCK_LATENCY_RE = re.compile(rb'Total: (\d+\.\d+)')
+
 MICRO = "µs"
 MILLI = "ms"
 
 def _parse_scheduling(log): 
-    tmp = findall(r'ACG construct: (\d+\.\d+)', log)
-    construct = [float(t) for t in tmp]
-    
-    tmp = findall(r'Hierachical sort: (\d+\.\d+)', log)
-    sort = [float(t) for t in tmp]
+    # cheap substring checks skip the regex scans on logs without the section
+    if b'ACG construct: ' not in log:
+        return [], [], [], []
     
-    tmp = findall(r'Reorder: (\d+\.\d+)', log)
-    reorder = [float(t) for t in tmp]
-    
-    tmp = findall(r'Extract schedule: (\d+\.\d+)', log)
-    extraction = [float(t) for t in tmp]
+    steps = {'construct': [], 'sort': [], 'reorder': [], 'extraction': []}
+    for m in _SCHEDULING_RE.finditer(log):
+        steps[m.lastgroup].append(float(m[m.lastgroup]))
         
-    return construct, sort, reorder, extraction
+    return steps['construct'], steps['sort'], steps['reorder'], steps['extraction']
 
 def _parse_throughput(log):
-    tmp = findall(r'thrpt:  \[\d+\.\d+ Kelem/s (\d+\.\d+) Kelem/s \d+\.\d+ Kelem/s\]', log)
+    tmp = _THRPT_RE.findall(log) if b'thrpt: ' in log else []
     if not tmp:
-        tmp = findall(r'Ktps: (\d+\.\d+)',log)
+        tmp = _KTPS_RE.findall(log)
     
-    return [float(tps) for tps in tmp]
+    return list(map(float, tmp))
         
 def _parse_latency(log):
-    tmp = findall(r'Total: \d+\.\d+, Simulation: (\d+\.\d+), Scheduling: \d+\.\d+, V_exec: \d+\.\d+, V_val: \d+\.\d+, Commit: \d+\.\d+, Other: \d+\.\d+', log)
-    simulation = [float(s) for s in tmp]
+    if b'Simulation: ' not in log:
+        return None
     
-    if simulation:
-        tmp = findall(r'Total: \d+\.\d+, Simulation: \d+\.\d+, Scheduling: (\d+\.\d+), V_exec: \d+\.\d+, V_val: \d+\.\d+, Commit: \d+\.\d+, Other: \d+\.\d+', log)
-        scheduling = [float(s) for s in tmp]
-        
-        tmp = findall(r'Total: \d+\.\d+, Simulation: \d+\.\d+, Scheduling: \d+\.\d+, V_exec: (\d+\.\d+), V_val: \d+\.\d+, Commit: \d+\.\d+, Other: \d+\.\d+', log)
-        v_exec = [float(s) for s in tmp]
+    # all six breakdown columns come from a single pass over the log
+    if rows := _LATENCY_RE.findall(log):
+        simulation, scheduling, v_exec, v_val, commit, other = (
+            list(map(float, column)) for column in zip(*rows))
         
-        tmp = findall(r'Total: \d+\.\d+, Simulation: \d+\.\d+, Scheduling: \d+\.\d+, V_exec: \d+\.\d+, V_val: (\d+\.\d+), Commit: \d+\.\d+, Other: \d+\.\d+', log)
-        v_val = [float(s) for s in tmp]
-        
-        tmp = findall(r'Total: \d+\.\d+, Simulation: \d+\.\d+, Scheduling: \d+\.\d+, V_exec: \d+\.\d+, V_val: \d+\.\d+, Commit: (\d+\.\d+), Other: \d+\.\d+', log)
-        commit = [float(s) for s in tmp]
-        
-        tmp = findall(r'Total: \d+\.\d+, Simulation: \d+\.\d+, Scheduling: \d+\.\d+, V_exec: \d+\.\d+, V_val: \d+\.\d+, Commit: \d+\.\d+, Other: (\d+\.\d+)', log)
-        other = [float(s) for s in tmp]
-        
-        tmp = findall(r'Ktps: (\d+\.\d+)', log)
-        ktps = [float(t) for t in tmp]
+        tmp = _KTPS_RE.findall(log)
+        ktps = list(map(float, tmp))
         
         return ktps, simulation, scheduling, v_exec, v_val, commit, other
     
     return None
 
 def _parse_tx_latency(log):
-    if tmp := findall(r'TX latency: (\d+\.\d+)', log):
-        tx_latency = [float(s) for s in tmp]
+    if b'TX latency: ' not in log:
+        return None
+    
+    if tmp := _TX_LATENCY_RE.findall(log):
+        tx_latency = list(map(float, tmp))
         
-        tmp = findall(r'Total: (\d+\.\d+)', log)
-        block_latency = [float(s) for s in tmp]
+        tmp = _BLOCK_LATENCY_RE.findall(log)
+        block_latency = list(map(float, tmp))
         
         return block_latency, tx_latency
     
     return None
 
 def result(log):
-    result = ""
+    parts = []
     
     if total := _parse_throughput(log):
-        result = "[Throughput (ktps)]\n"
-        for ktps in total:
-            result += f"{ktps} \n"
+        parts.append("[Throughput (ktps)]\n")
+        parts.extend(f"{ktps} \n" for ktps in total)
         
         
     if latency:= _parse_latency(log):
         ktps, simulation, scheduling, v_exec, v_val, commit, other = latency
-        result += "\n[Latency (Ktps; simulation (ms); scheduling (ms); v_exec (ms); v_val (ms); commit (ms); other (ms))]\n"
-        for k, si, sc, ve, vv, c, o in zip(ktps, simulation, scheduling, v_exec, v_val, commit, other, strict=True):
-            result += f"{k} {si} {sc} {ve} {vv} {c} {o}\n"
+        parts.append("\n[Latency (Ktps; simulation (ms); scheduling (ms); v_exec (ms); v_val (ms); commit (ms); other (ms))]\n")
+        parts.extend(
+            f"{k} {si} {sc} {ve} {vv} {c} {o}\n"
+            for k, si, sc, ve, vv, c, o in zip(ktps, simulation, scheduling, v_exec, v_val, commit, other, strict=True)
+        )
     
     if latency := _parse_tx_latency(log):
         block_latency, tx_latency = latency
-        result += "\n[Block latency (ms); TX latency (ms)]\n"
-        for b, tx in zip(block_latency, tx_latency, strict=True):
-            result += f"{b} {tx}\n"
+        parts.append("\n[Block latency (ms); TX latency (ms)]\n")
+        parts.extend(f"{b} {tx}\n" for b, tx in zip(block_latency, tx_latency, strict=True))
     
     construct, sort, reorder, extraction = _parse_scheduling(log)
     if construct:
-        result += "\n[ACG construction]\n"
-        for duration in construct:
-            result += f"{duration} \n"
+        parts.append("\n[ACG construction]\n")
+        parts.extend(f"{duration} \n" for duration in construct)
         
-        result += "\n[Hierarchical sorting]\n"
-        for duration in sort:
-            result += f"{duration} \n"
+        parts.append("\n[Hierarchical sorting]\n")
+        parts.extend(f"{duration} \n" for duration in sort)
             
-        result += "\n[Reordering]\n"
-        for duration in reorder:
-            result += f"{duration} \n"
+        parts.append("\n[Reordering]\n")
+        parts.extend(f"{duration} \n" for duration in reorder)
             
         
-    return result
+    return "".join(parts)
 
 def process(target_file):
     assert isinstance(target_file, str)
     
     for filename in sorted(glob(target_file)):
-        log = ""
-        with open(filename, 'r') as f:
+        log = b""
+        with open(filename, 'rb') as f:
             log = f.read()
     
-        with open(filename.split()[0]+".out", 'a') as f:
+        with open(splitext(filename)[0] + ".out", 'a', buffering=1 << 16) as f:
             f.write(result(log))
             
 if __name__ == "__main__":
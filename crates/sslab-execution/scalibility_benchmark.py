@@ -1,4 +1,15 @@
+import hashlib
+import json
+import os
+import re
+from glob import glob
+import selectors
+import shlex
+import shutil
 import subprocess
+import sys
+import tempfile
+from dataclasses import dataclass, field
 from subprocess import STDOUT
 from datetime import datetime
     
@@ -18,53 +29,294 @@ class ExecutionModel:
     
 
 
-benchmarks = [BenchmarkType.THROUGHPUT_BLOCK_SIZE] # [BenchmarkType.LATENCY_SKEWNESS, BenchmarkType.THROUGHPUT_BLOCK_SIZE, BenchmarkType.THROUGHPUT_SKEWNESS] 
-execution_models = [ExecutionModel.OPTME, ExecutionModel.BLOCKSTM, ExecutionModel.NEZHA]
-num_of_threads = [4, 8, 16, 24, 32]
+benchmarks = frozenset({BenchmarkType.THROUGHPUT_BLOCK_SIZE}) # {BenchmarkType.LATENCY_SKEWNESS, BenchmarkType.THROUGHPUT_BLOCK_SIZE, BenchmarkType.THROUGHPUT_SKEWNESS}
+execution_models = (ExecutionModel.OPTME, ExecutionModel.BLOCKSTM, ExecutionModel.NEZHA)
+num_of_threads = (4, 8, 16, 24, 32)
 
-for model in execution_models:
-    for nthreads in num_of_threads:
+# taken once so that every log of a run shares (and sorts by) the same prefix;
+# the model tag and thread count keep concurrent jobs' filenames distinct
+RUN_TS = datetime.now().strftime('%Y%m%dT%H%M%S')
+
+# concurrent jobs are pinned to disjoint cores where taskset exists (Linux)
+PIN_CORES = shutil.which("taskset") is not None
+
+# logs are staged in RAM (tmpfs) while the benchmark runs, so the run itself
+# never waits on the disk and a half-written log never shows up under its name
+STAGING_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+# criterion's per-benchmark estimate line, e.g. "time:   [1.02 ms 1.05 ms 1.09 ms]"
+_PROGRESS_RE = re.compile(rb'time:\s+\[([\d.]+) (\w+)')
+
+# the live progress line is only drawn on a terminal; CLEAR wipes it before
+# any other message is printed over it
+TTY = sys.stdout.isatty()
+CLEAR = "\r\x1b[K" if TTY else ""
+
+# each job saves a criterion baseline named after its tag; a sidecar in
+# CACHE_DIR records the bench binaries it was measured with, so a later run
+# can skip jobs whose binaries are unchanged and whose baseline is still on disk
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+TARGET_DIR = os.environ.get("CARGO_TARGET_DIR", os.path.join(REPO_ROOT, "target"))
+CRITERION_DIR = os.path.join(TARGET_DIR, "criterion")
+CACHE_DIR = os.path.join(TARGET_DIR, "benches-cache")
+
+
+@dataclass(frozen=True, slots=True)
+class Job:
+    model: str                  # short model name, also tags the log file
+    nthreads: int
+    bench: str                  # log file suffix
+    cargo_args: tuple[str, ...] # package / feature selection
+    filter: str                 # criterion benchmark filter
+
+    @property
+    def filename(self):
+        return f"{RUN_TS}-{self.model}-{self.nthreads}-{self.bench}.log"
+
+    @property
+    def tag(self):
+        return f"{self.model}-{self.nthreads}-{self.bench}"
+
+    @property
+    def criterion_home(self):
+        # criterion measures into <home>/<id>/new before copying that to the
+        # named baseline, so concurrent jobs measuring the same benchmark id
+        # each need their own home or they save each other's data
+        return os.path.join(CRITERION_DIR, self.tag)
+
+
+@dataclass(slots=True)
+class Running:
+    job: Job
+    cores: list
+    proc: subprocess.Popen
+    log: object
+    staged: str
+    sha: str | None
+    estimates: int = 0          # criterion estimates seen so far
+    last: str = field(default="-")
+
+
+# which benchmark types run is fixed for the whole script, so decide it once
+# here instead of once per (model, nthreads) pair
+DO_BLOCKSIZE = BenchmarkType.THROUGHPUT_BLOCK_SIZE in benchmarks
+DO_SKEW_TPS = BenchmarkType.THROUGHPUT_SKEWNESS in benchmarks
+DO_SKEW_LAT = BenchmarkType.LATENCY_SKEWNESS in benchmarks
+
+JOBS = []
+if DO_BLOCKSIZE:
+    # measure throughput according to blocksize
+    JOBS += [Job(model[0], nthreads, "blocksize", tuple(shlex.split(model[1])), "blocksize")
+             for model in execution_models for nthreads in num_of_threads]
+if DO_SKEW_TPS:
+    # measure throughput according to skewness
+    JOBS += [Job(model[0], nthreads, "skewness", tuple(shlex.split(model[1])), "skewness")
+             for model in execution_models for nthreads in num_of_threads]
+if DO_SKEW_LAT:
+    # measure latency according to skewness; only optme and blockstm have a latency bench
+    JOBS += [Job(model[0], nthreads, "latency", ("-p", f"sslab-execution-{model[0]}", "--features=latency"), model[0])
+             for model in execution_models if model in (ExecutionModel.OPTME, ExecutionModel.BLOCKSTM)
+             for nthreads in num_of_threads]
+
+
+def core_slices():
+    # one slice per concurrent job, each wide enough for the largest nthreads.
+    # Both the number and the contents of the slices come from the cores this
+    # process may actually use (a cpuset or outer taskset can restrict it), and
+    # with fewer cores than one slice needs, the single job gets all of them.
+    width = max(num_of_threads)
+    if hasattr(os, "sched_getaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count()))
+    count = max(1, len(cpus) // width)
+    return [cpus[i * width:(i + 1) * width] for i in range(count)]
+
+
+def prebuild(cargo_args):
+    # returns the bench executables cargo built (or found up to date), or None
+    # when the build fails so that only this model's jobs are dropped
+    argv = ["cargo", "bench", *cargo_args, "--benches", "--no-run", "--message-format=json-render-diagnostics"]
+    print(shlex.join(argv))
+    try:
+        messages = subprocess.run(argv, check=True, stdout=subprocess.PIPE, text=True).stdout
+    except subprocess.CalledProcessError as e:
+        print(f"{shlex.join(cargo_args)}: build failed with {e.returncode}, skipping its jobs")
+        return None
     
-        if BenchmarkType.THROUGHPUT_BLOCK_SIZE in benchmarks:
-            
-            # measure throughput according to blocksize
-            filename = f"{datetime.today().strftime('%Y-%m-%d-%H:%M')}-{model[0]}-{nthreads}-blocksize.log"
-            cmd = f"RAYON_NUM_THREADS={nthreads} cargo bench {model[1]}" 
-            cmd += f" -- blocksize > {filename} 2>&1"
-            print(cmd)
-            subprocess.call(cmd, shell=True, stderr=STDOUT)
-            
-            # # parse output 
-            # cmd_parsing = f"python3 ./{model}/benches/parse_log.py {filename}"
-            # subprocess.call(cmd_parsing, shell=True, stderr=STDOUT)
-        
-        
-        # if BenchmarkType.THROUGHPUT_SKEWNESS in benchmarks \
-        #     and workload in (WorkloadType.SMALLBANK, WorkloadType.YOUTUBE):
-            
-        #     # measure throughput according to skewness    
-        #     filename = f"{datetime.today().strftime('%Y-%m-%d-%H:%M')}-{workload}-s{model}-{nthreads}-skewness.log"
-        #     cmd = f"WORKLOAD={workload} RAYON_NUM_THREADS={nthreads} cargo bench -p sslab-execution-{model}"
-        #     if model == ExecutionModel.OPTME:
-        #         cmd += f" --features={model}" 
-        #     cmd += f" -- skewness > {filename} 2>&1"
-        #     print(cmd)
-        #     subprocess.call(cmd, shell=True, stderr=STDOUT)
-
-        #     cmd_parsing = f"python3 ./{model}/benches/parse_log.py {filename}"
-        #     subprocess.call(cmd_parsing, shell=True, stderr=STDOUT)
-            
-        # if BenchmarkType.LATENCY_SKEWNESS in benchmarks \
-        #     and model in (ExecutionModel.OPTME, ExecutionModel.BLOCKSTM):
+    executables = []
+    for line in messages.splitlines():
+        try:
+            message = json.loads(line)
+        except ValueError:
+            continue
+        if message.get("reason") == "compiler-artifact" and message.get("executable") \
+                and "bench" in message["target"]["kind"]:
+            executables.append(message["executable"])
+    return executables
+
+
+def build_digest(executables):
+    # digest of the bench binaries themselves. They are cargo's own fingerprint
+    # of everything they were built from (every crate in the dependency graph,
+    # Cargo.toml profiles, the toolchain), so any input that could change the
+    # numbers changes the digest; None when the build reported no bench binary
+    if not executables:
+        return None
+    digest = hashlib.sha1()
+    try:
+        for executable in sorted(executables):
+            with open(executable, "rb") as f:
+                while chunk := f.read(1 << 20):
+                    digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def build_sha(job, digest):
+    # the cache key: the build's digest plus the job's cargo flags and filter
+    if digest is None:
+        return None
+    return f"{digest}\n{shlex.join([*job.cargo_args, job.filter])}\n"
+
+
+def sidecar(job):
+    return os.path.join(CACHE_DIR, f"{job.tag}.sha")
+
+
+def cached(job, sha):
+    if sha is None:
+        return False
+    try:
+        with open(sidecar(job)) as f:
+            if f.read() != sha:
+                return False
+    except FileNotFoundError:
+        return False
+    return bool(glob(os.path.join(job.criterion_home, "**", job.tag), recursive=True))
+
+
+def start(job, cores, sha):
+    # --benches leaves out the packages' lib targets on purpose: their libtest
+    # harness would run first and reject criterion's --save-baseline option
+    argv = ["cargo", "bench", *job.cargo_args, "--benches", "--", job.filter, "--save-baseline", job.tag]
+    if PIN_CORES:
+        argv = ["taskset", "-c", ",".join(map(str, cores[:job.nthreads])), *argv]
+    env = {**os.environ, "RAYON_NUM_THREADS": str(job.nthreads), "CRITERION_HOME": job.criterion_home}
+    print(f"{CLEAR}RAYON_NUM_THREADS={job.nthreads} CRITERION_HOME={job.criterion_home} {shlex.join(argv)} > {job.filename} 2>&1")
+    
+    # the output is drained by the reactor into a 1 MiB buffered file, so the
+    # log is written in large chunks rather than once per output line
+    staged = os.path.join(STAGING_DIR, f"{job.filename}.partial")
+    log = open(staged, "wb", buffering=1 << 20)
+    try:
+        proc = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=STDOUT, env=env, bufsize=0)
+    except BaseException:
+        log.close()
+        os.remove(staged)
+        raise
+    return Running(job, cores, proc, log, staged, sha)
+
+
+def finish(running):
+    running.log.close()
+    job, returncode = running.job, running.proc.wait()
+    
+    if returncode != 0:
+        print(f"{CLEAR}{job.filename}: exited with {returncode}, partial log kept at {running.staged}")
+        return
+    
+    # the staging dir is usually another filesystem, so copy next to the
+    # final path first; the rename into place is then atomic
+    partial = f"{job.filename}.partial"
+    shutil.copyfile(running.staged, partial)
+    os.replace(partial, job.filename)
+    os.remove(running.staged)
+    
+    if running.sha is not None:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(sidecar(job), "w") as f:
+            f.write(running.sha)
+
+
+def stop(running):
+    running.proc.terminate()
+    try:
+        running.proc.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        running.proc.kill()
+        running.proc.wait()
+    running.log.close()
+
+
+def show_progress(done, total, live):
+    if not TTY:
+        return
+    jobs = " | ".join(
+        f"{r.job.model}-{r.job.nthreads}: #{r.estimates} {r.last}" for r in live)
+    print(f"{CLEAR}[{done}/{total}] {jobs}", end="", flush=True)
+
+
+def run_all(jobs, slices, shas):
+    # one reactor drains every running job's pipe as data arrives; a job is
+    # started whenever a core slice is free, so no two jobs share cores
+    pending, free = list(reversed(jobs)), list(slices)
+    selector = selectors.DefaultSelector()
+    done = 0
+    try:
+        while pending or selector.get_map():
+            while pending and free:
+                job = pending.pop()
+                running = start(job, free.pop(), shas[job])
+                selector.register(running.proc.stdout, selectors.EVENT_READ, running)
             
-        #     # measure latency according to skewness    
-        #     filename = f"{datetime.today().strftime('%Y-%m-%d-%H:%M')}-{workload}-s{model}-{nthreads}-latency.log"
-        #     cmd = f"WORKLOAD={workload} RAYON_NUM_THREADS={nthreads} cargo bench -p sslab-execution-{model}"
-        #     cmd += f" --features=latency"
-        #     cmd += f" -- {model} > {filename} 2>&1"
-        #     print(cmd)
-        #     subprocess.call(cmd, shell=True, stderr=STDOUT)
+            for key, _ in selector.select():
+                running = key.data
+                if chunk := os.read(key.fd, 1 << 16):
+                    running.log.write(chunk)
+                    if estimates := _PROGRESS_RE.findall(chunk):
+                        running.estimates += len(estimates)
+                        running.last = b" ".join(estimates[-1]).decode()
+                    continue
+                
+                selector.unregister(key.fileobj)
+                key.fileobj.close()
+                finish(running)
+                free.append(running.cores)
+                done += 1
             
-        #     cmd_parsing = f"python3 ./{model}/benches/parse_log.py {filename}"
-        #     subprocess.call(cmd_parsing, shell=True, stderr=STDOUT)
-            
\ No newline at end of file
+            show_progress(done, len(jobs), [key.data for key in selector.get_map().values()])
+    except BaseException:
+        # Ctrl-C or any failure in the driver itself: nobody would drain the
+        # remaining children's pipes any more, so stop them before re-raising
+        for key in list(selector.get_map().values()):
+            print(f"{CLEAR}stopped, partial log kept at {key.data.staged}")
+            stop(key.data)
+        raise
+    finally:
+        selector.close()
+    print(CLEAR, end="")
+
+
+if __name__ == "__main__":
+    # thread count is only a runtime env var, so compile each model's benches
+    # once up front; the jobs' own cargo invocations then find them fresh
+    builds = {cargo_args: prebuild(cargo_args)
+              for cargo_args in dict.fromkeys(job.cargo_args for job in JOBS)}
+    built = [job for job in JOBS if builds[job.cargo_args] is not None]
+    
+    # the binaries are shared by every thread count, so each build is hashed once
+    digests = {cargo_args: build_digest(executables)
+               for cargo_args, executables in builds.items() if executables is not None}
+    shas = {job: build_sha(job, digests[job.cargo_args]) for job in built}
+    jobs = []
+    for job in built:
+        if cached(job, shas[job]):
+            print(f"skip {job.tag} (cached)")
+        else:
+            jobs.append(job)
+    
+    # jobs are independent; run as many at once as the cores allow while
+    # still giving each job its full RAYON_NUM_THREADS.
+    run_all(jobs, core_slices(), shas)
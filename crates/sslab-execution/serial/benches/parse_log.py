@@ -1,32 +1,34 @@
-from re import findall
+import re
 from glob import glob
+from os.path import splitext
 import sys
 
+_THRPT_RE = re.compile(rb'thrpt:  \[\d+\.\d+ Kelem/s (\d+\.\d+) Kelem/s \d+\.\d+ Kelem/s\]')
+
 
 def _parse_throughput(log):
-    tmp = findall(r'thrpt:  \[\d+\.\d+ Kelem/s (\d+\.\d+) Kelem/s \d+\.\d+ Kelem/s\]', log)
+    tmp = _THRPT_RE.findall(log)
     
-    return [float(tps) for tps in tmp]
+    return list(map(float, tmp))
         
 
 def result(log):
     
     total = _parse_throughput(log)
-    result = "[Throughput (ktps)]\n"
-    for ktps in total:
-        result += f"{ktps} \n"
+    parts = ["[Throughput (ktps)]\n"]
+    parts.extend(f"{ktps} \n" for ktps in total)
         
-    return result
+    return "".join(parts)
 
 def process(target_file):
     assert isinstance(target_file, str)
     
     for filename in sorted(glob(target_file)):
-        log = ""
-        with open(filename, 'r') as f:
+        log = b""
+        with open(filename, 'rb') as f:
             log = f.read()
     
-        with open(filename.split()[0]+".out", 'a') as f:
+        with open(splitext(filename)[0] + ".out", 'a', buffering=1 << 16) as f:
             f.write(result(log))
             
 if __name__ == "__main__":
@@ -2,23 +2,99 @@
 # Copyright (c) Mysten Labs, Inc.
 # SPDX-License-Identifier: Apache-2.0
 from datetime import datetime, timezone
+from functools import cached_property, lru_cache
 from itertools import chain
-from dateutil import parser
 from glob import glob
 from logging import exception
+from mmap import mmap, ACCESS_READ
 from multiprocessing import Pool
 from os.path import join
-from re import findall, search
-from statistics import mean
+import re
+
+import numpy as np
 
 
 from benchmark.utils import Print
 
 
+# All patterns are compiled at import time: forked pool workers inherit them,
+# and spawned workers compile them while importing this module, before their
+# first task.
+#
+# A single alternation per log type, so that each log is scanned only once.
+# Every alternative is wrapped in an outer named group, which is reported by
+# `lastgroup` and used to dispatch the match.
+_PRIMARY_RE = re.compile(
+    rb'^(?P<ts>\S+) .*?(?:'
+    rb'(?P<proposal> Created B\d+\([^ ]+\) -> (?P<proposal_digest>[^ ]+=))'
+    rb'|(?P<commit> Committed B\d+\([^ ]+\) -> (?P<commit_digest>[^ ]+=))'
+    rb'|(?P<batch_to_header> Batch (?P<b2h_digest>[^ ]+) from worker \d+ took (?P<b2h_latency>\d+\.\d+) seconds from creation to be included in a proposed header)'
+    rb'|(?P<header_creation> Header (?P<hc_digest>[^ ]+) was created in (?P<hc_latency>\d+\.\d+) seconds)'
+    rb'|(?P<header_to_cert> Header (?P<h2c_digest>[^ ]+) at round \d+ with \d+ batches, took (?P<h2c_latency>\d+\.\d+) seconds to be materialized to a certificate \S+)'
+    rb'|(?P<cert_commit> Certificate (?P<cc_digest>[^ ]+) took (?P<cc_latency>\d+\.\d+) seconds to be committed at round \d+)'
+    rb'|(?P<request_vote>\/narwhal\.PrimaryToPrimary\/RequestVote.*direction=outbound.*latency=(?P<rv_latency>\d+) ms)'
+    rb')',
+    re.MULTILINE
+)
+
+_WORKER_RE = re.compile(
+    rb'(?P<size>Batch (?P<size_digest>[^ ]+) contains (?P<size_bytes>\d+) B)'
+    rb'|(?P<sample>Batch (?P<sample_digest>[^ ]+) contains sample tx (?P<sample_tx>\d+))'
+    rb'|(?P<creation> Batch (?P<creation_digest>[^ ]+) took (?P<creation_latency>\d+\.\d+) seconds to create due to )'
+)
+
+_TX_SIZE_RE = re.compile(rb'Transactions size: (\d+)')
+_TX_RATE_RE = re.compile(rb'Transactions rate: (\d+)')
+_START_RE = re.compile(rb'^(\S+) .*? Start ', re.MULTILINE)
+_MISS_RE = re.compile(rb'rate too high')
+_CLIENT_SAMPLE_RE = re.compile(
+    rb'^(\S+) .*? sample transaction (\d+)', re.MULTILINE)
+_BOOT_RE = re.compile(rb'booted on (/ip4/\d+.\d+.\d+.\d+)')
+_GRPC_PORT_RE = re.compile(
+    rb'Consensus API gRPC Server listening on /ip4/.+/tcp/(.+)/http')
+
+_CONFIG_RES = {
+    'header_num_of_batches_threshold': re.compile(
+        rb'Header number of batches threshold .* (\d+)'),
+    'max_header_num_of_batches': re.compile(
+        rb'Header max number of batches .* (\d+)'),
+    'max_header_delay': re.compile(rb'Max header delay .* (\d+)'),
+    'gc_depth': re.compile(rb'Garbage collection depth .* (\d+)'),
+    'sync_retry_delay': re.compile(rb'Sync retry delay .* (\d+)'),
+    'sync_retry_nodes': re.compile(rb'Sync retry nodes .* (\d+)'),
+    'batch_size': re.compile(rb'Batch size .* (\d+)'),
+    'max_batch_delay': re.compile(rb'Max batch delay .* (\d+)'),
+    'max_concurrent_requests': re.compile(rb'Max concurrent requests .* (\d+)'),
+}
+
+
 class ParseError(Exception):
     pass
 
 
+@lru_cache(maxsize=None)
+def _posix_seconds(prefix):
+    # Most log lines share their second with the previous one, so whole
+    # seconds are parsed once and cached.
+    return datetime(
+        int(prefix[0:4]), int(prefix[5:7]), int(prefix[8:10]),
+        int(prefix[11:13]), int(prefix[14:16]), int(prefix[17:19]),
+        tzinfo=timezone.utc
+    ).timestamp()
+
+
+def _mean(values):
+    # Reduce in NumPy rather than walking the values in the interpreter.
+    return float(np.fromiter(values, dtype=np.float64).mean())
+
+
+def _map_log(filename):
+    # Map the log read-only so that parsers scan the page cache directly rather
+    # than a decoded copy of the whole file.
+    with open(filename, 'rb') as f:
+        return mmap(f.fileno(), 0, access=ACCESS_READ)
+
+
 class LogParser:
     def __init__(self, clients, primaries, workers, faults=0):
         inputs = [clients, primaries, workers]
@@ -34,58 +110,75 @@ class LogParser:
             self.committee_size = '?'
             self.workers = '?'
 
-        # Parse the clients logs.
-        try:
-            with Pool() as p:
-                results = p.map(self._parse_clients, clients)
-        except (ValueError, IndexError, AttributeError) as e:
-            exception(e)
-            raise ParseError(f'Failed to parse clients\' logs: {e}')
+        # Share a single pool across all logs; the clients, primaries, and
+        # workers logs are submitted together and parsed concurrently. Tasks
+        # only carry a filename, so each log is sent as its own task to keep
+        # the workers balanced when there are more logs than processes.
+        with Pool() as p:
+            client_results = p.map_async(
+                self._parse_clients, clients, chunksize=1)
+            primary_results = p.map_async(
+                self._parse_primaries, primaries, chunksize=1)
+            worker_results = p.map_async(
+                self._parse_workers, workers, chunksize=1)
+
+            # Parse the clients logs.
+            try:
+                client_results = client_results.get()
+            except (ValueError, IndexError, AttributeError) as e:
+                exception(e)
+                raise ParseError(f'Failed to parse clients\' logs: {e}')
+
+            # Parse the primaries logs.
+            try:
+                primary_results = primary_results.get()
+            except (ValueError, IndexError, AttributeError) as e:
+                exception(e)
+                raise ParseError(f'Failed to parse nodes\' logs: {e}')
+
+            # Parse the workers logs.
+            try:
+                worker_results = worker_results.get()
+            except (ValueError, IndexError, AttributeError) as e:
+                exception(e)
+                raise ParseError(f'Failed to parse workers\' logs: {e}')
+
         self.size, self.rate, self.start, misses, self.sent_samples \
-            = zip(*results)
+            = zip(*client_results)
         self.misses = sum(misses)
 
-        # Parse the primaries logs.
-        try:
-            with Pool() as p:
-                results = p.map(self._parse_primaries, primaries)
-        except (ValueError, IndexError, AttributeError) as e:
-            exception(e)
-            raise ParseError(f'Failed to parse nodes\' logs: {e}')
         proposals, commits, self.configs, primary_ips, batch_to_header_latencies, header_creation_latencies, header_to_cert_latencies, cert_commit_latencies, request_vote_outbound_latencies = zip(
-            *results)
-        self.proposals = self._merge_results([x.items() for x in proposals])
-        self.commits = self._merge_results([x.items() for x in commits])
-        self.batch_to_header_latencies = {
-            k: v for x in batch_to_header_latencies for k, v in x.items()
-        }
-        self.header_creation_latencies = {
-            k: v for x in header_creation_latencies for k, v in x.items()
-        }
-        self.header_to_cert_latencies = {
-            k: v for x in header_to_cert_latencies for k, v in x.items()
-        }
-        self.cert_commit_latencies = {
-            k: v for x in cert_commit_latencies for k, v in x.items()
+            *primary_results)
+        self.proposals = self._merge_results(proposals)
+        self.commits = self._merge_results(commits)
+
+        # Give every batch digest an index, and lay out the proposal and
+        # commit timestamps as arrays aligned on it (NaN where missing), so
+        # that latencies are array arithmetic rather than dict joins.
+        self.digest_ids = {
+            d: i for i, d in enumerate(dict.fromkeys(
+                chain(self.proposals, self.commits)))
         }
+        self.proposal_times = self._align(self.proposals)
+        self.commit_times = self._align(self.commits)
+        self.batch_to_header_latencies = self._union_results(
+            batch_to_header_latencies)
+        self.header_creation_latencies = self._union_results(
+            header_creation_latencies)
+        self.header_to_cert_latencies = self._union_results(
+            header_to_cert_latencies)
+        self.cert_commit_latencies = self._union_results(
+            cert_commit_latencies)
         self.request_vote_outbound_latencies = list(
             chain(*request_vote_outbound_latencies))
 
-        # Parse the workers logs.
-        try:
-            with Pool() as p:
-                results = p.map(self._parse_workers, workers)
-        except (ValueError, IndexError, AttributeError) as e:
-            exception(e)
-            raise ParseError(f'Failed to parse workers\' logs: {e}')
         sizes, self.received_samples, workers_ips, batch_creation_latencies = zip(
-            *results)
+            *worker_results)
         self.sizes = {
             k: v for x in sizes for k, v in x.items() if k in self.commits
         }
-        self.batch_creation_latencies = {
-            k: v for x in batch_creation_latencies for k, v in x.items()
-        }
+        self.batch_creation_latencies = self._union_results(
+            batch_creation_latencies)
 
         # Determine whether the primary and the workers are collocated.
         self.collocate = set(primary_ips) == set(workers_ips)
@@ -96,155 +189,172 @@ class LogParser:
                 f'Clients missed their target rate {self.misses:,} time(s)'
             )
 
+    def _union_results(self, input):
+        union = {}
+        for x in input:
+            union.update(x)
+        return union
+
     def _merge_results(self, input):
         # Keep the earliest timestamp.
         merged = {}
         for x in input:
-            for k, v in x:
-                if k not in merged or merged[k] > v:
+            for k, v in x.items():
+                if merged.get(k, v) >= v:
                     merged[k] = v
         return merged
 
-    def _parse_clients(self, log):
-        if search(r'Error', log) is not None:
-            raise ParseError('Client(s) panicked')
-
-        size = int(search(r'Transactions size: (\d+)', log).group(1))
-        rate = int(search(r'Transactions rate: (\d+)', log).group(1))
-
-        tmp = search(r'(.*?) .* Start ', log).group(1)
-        start = self._to_posix(tmp)
-
-        misses = len(findall(r'rate too high', log))
-
-        tmp = findall(r'(.*?) .* sample transaction (\d+)', log)
-        samples = {int(s): self._to_posix(t) for t, s in tmp}
-
-        return size, rate, start, misses, samples
-
-    def _parse_primaries(self, log):
-        if search(r'(?:panicked)', log) is not None:
-            raise ParseError('Primary(s) panicked')
-
-        tmp = findall(r'(.*?) .* Created B\d+\([^ ]+\) -> ([^ ]+=)', log)
-        tmp = [(d, self._to_posix(t)) for t, d in tmp]
-        proposals = self._merge_results([tmp])
-
-        tmp = findall(r'(.*?) .* Committed B\d+\([^ ]+\) -> ([^ ]+=)', log)
-        tmp = [(d, self._to_posix(t)) for t, d in tmp]
-        commits = self._merge_results([tmp])
-
-        tmp = findall(
-            r'.* Batch ([^ ]+) from worker \d+ took (\d+\.\d+) seconds from creation to be included in a proposed header', log)
-        batch_to_header_latencies = {d: float(t) for d, t in tmp}
-
-        tmp = findall(
-            r'.* Header ([^ ]+) was created in (\d+\.\d+) seconds', log)
-        header_creation_latencies = {d: float(t) for d, t in tmp}
-
-        tmp = findall(
-            r'.* Header ([^ ]+) at round \d+ with \d+ batches, took (\d+\.\d+) seconds to be materialized to a certificate [^ ]+', log)
-        header_to_cert_latencies = {d: float(t) for d, t in tmp}
-
-        tmp = findall(
-            r'.* Certificate ([^ ]+) took (\d+\.\d+) seconds to be committed at round \d+', log)
-        cert_commit_latencies = {d: float(t) for d, t in tmp}
-
-        tmp = findall(
-            r'\/narwhal\.PrimaryToPrimary\/RequestVote.*direction=outbound.*latency=(\d+) ms', log)
-        request_vote_outbound_latencies = [float(d) for d in tmp]
-
-        configs = {
-            'header_num_of_batches_threshold': int(
-                search(r'Header number of batches threshold .* (\d+)', log).group(1)
-            ),
-            'max_header_num_of_batches': int(
-                search(r'Header max number of batches .* (\d+)', log).group(1)
-            ),
-            'max_header_delay': int(
-                search(r'Max header delay .* (\d+)', log).group(1)
-            ),
-            'gc_depth': int(
-                search(r'Garbage collection depth .* (\d+)', log).group(1)
-            ),
-            'sync_retry_delay': int(
-                search(r'Sync retry delay .* (\d+)', log).group(1)
-            ),
-            'sync_retry_nodes': int(
-                search(r'Sync retry nodes .* (\d+)', log).group(1)
-            ),
-            'batch_size': int(
-                search(r'Batch size .* (\d+)', log).group(1)
-            ),
-            'max_batch_delay': int(
-                search(r'Max batch delay .* (\d+)', log).group(1)
-            ),
-            'max_concurrent_requests': int(
-                search(r'Max concurrent requests .* (\d+)', log).group(1)
-            )
-        }
-
-        ip = search(r'booted on (/ip4/\d+.\d+.\d+.\d+)', log).group(1)
-
-        return proposals, commits, configs, ip, batch_to_header_latencies, header_creation_latencies, header_to_cert_latencies, cert_commit_latencies, request_vote_outbound_latencies
-
-    def _parse_workers(self, log):
-        if search(r'(?:panicked)', log) is not None:
-            raise ParseError('Worker(s) panicked')
-
-        tmp = findall(r'Batch ([^ ]+) contains (\d+) B', log)
-        sizes = {d: int(s) for d, s in tmp}
-
-        tmp = findall(r'Batch ([^ ]+) contains sample tx (\d+)', log)
-        samples = {int(s): d for d, s in tmp}
-
-        tmp = findall(
-            r'.* Batch ([^ ]+) took (\d+\.\d+) seconds to create due to .*', log)
-        batch_creation_latencies = {d: float(t) for d, t in tmp}
-
-        ip = search(r'booted on (/ip4/\d+.\d+.\d+.\d+)', log).group(1)
-
-        return sizes, samples, ip, batch_creation_latencies
+    def _parse_clients(self, filename):
+        with _map_log(filename) as log:
+            if log.find(b'Error') != -1:
+                raise ParseError('Client(s) panicked')
+
+            size = int(_TX_SIZE_RE.search(log).group(1))
+            rate = int(_TX_RATE_RE.search(log).group(1))
+
+            tmp = _START_RE.search(log).group(1)
+            start = self._to_posix(tmp)
+
+            misses = sum(1 for _ in _MISS_RE.finditer(log))
+
+            tmp = _CLIENT_SAMPLE_RE.findall(log)
+            samples = {int(s): self._to_posix(t) for t, s in tmp}
+
+            return size, rate, start, misses, samples
+
+    def _parse_primaries(self, filename):
+        with _map_log(filename) as log:
+            if log.find(b'panicked') != -1:
+                raise ParseError('Primary(s) panicked')
+
+            proposals, commits = {}, {}
+            batch_to_header_latencies = {}
+            header_creation_latencies = {}
+            header_to_cert_latencies = {}
+            cert_commit_latencies = {}
+            request_vote_outbound_latencies = []
+            for m in _PRIMARY_RE.finditer(log):
+                kind = m.lastgroup
+                if kind == 'proposal':
+                    # Keep the earliest timestamp.
+                    d, t = m['proposal_digest'], self._to_posix(m['ts'])
+                    if proposals.get(d, t) >= t:
+                        proposals[d] = t
+                elif kind == 'commit':
+                    d, t = m['commit_digest'], self._to_posix(m['ts'])
+                    if commits.get(d, t) >= t:
+                        commits[d] = t
+                elif kind == 'batch_to_header':
+                    batch_to_header_latencies[m['b2h_digest']] = float(
+                        m['b2h_latency'])
+                elif kind == 'header_creation':
+                    header_creation_latencies[m['hc_digest']] = float(
+                        m['hc_latency'])
+                elif kind == 'header_to_cert':
+                    header_to_cert_latencies[m['h2c_digest']] = float(
+                        m['h2c_latency'])
+                elif kind == 'cert_commit':
+                    cert_commit_latencies[m['cc_digest']] = float(
+                        m['cc_latency'])
+                elif kind == 'request_vote':
+                    request_vote_outbound_latencies += [float(m['rv_latency'])]
+
+            configs = {
+                k: int(pattern.search(log).group(1))
+                for k, pattern in _CONFIG_RES.items()
+            }
+
+            ip = _BOOT_RE.search(log).group(1)
+
+            return proposals, commits, configs, ip, batch_to_header_latencies, header_creation_latencies, header_to_cert_latencies, cert_commit_latencies, request_vote_outbound_latencies
+
+    def _parse_workers(self, filename):
+        with _map_log(filename) as log:
+            if log.find(b'panicked') != -1:
+                raise ParseError('Worker(s) panicked')
+
+            sizes, samples, batch_creation_latencies = {}, {}, {}
+            for m in _WORKER_RE.finditer(log):
+                kind = m.lastgroup
+                if kind == 'size':
+                    sizes[m['size_digest']] = int(m['size_bytes'])
+                elif kind == 'sample':
+                    samples[int(m['sample_tx'])] = m['sample_digest']
+                elif kind == 'creation':
+                    batch_creation_latencies[m['creation_digest']] = float(
+                        m['creation_latency'])
+
+            ip = _BOOT_RE.search(log).group(1)
+
+            return sizes, samples, ip, batch_creation_latencies
+
+    def _align(self, timestamps):
+        aligned = np.full(len(self.digest_ids), np.nan)
+        ids = np.fromiter(
+            (self.digest_ids[d] for d in timestamps),
+            dtype=np.intp, count=len(timestamps))
+        aligned[ids] = np.fromiter(
+            timestamps.values(), dtype=np.float64, count=len(timestamps))
+        return aligned
 
     def _to_posix(self, string):
-        x = parser.parse(string[:24], ignoretz=True)
-        x = x.astimezone(timezone.utc)
-        return datetime.timestamp(x)
+        # Timestamps are RFC 3339 in UTC, e.g. 2022-01-01T00:00:00.123Z: the
+        # fraction has 1-9 digits and is left out entirely on whole seconds.
+        frac = string[19:].rstrip(b'Z')
+        return _posix_seconds(string[:19]) + (float(frac) if frac else 0.0)
+
+    @cached_property
+    def sizes_sum(self):
+        # Total bytes of the committed batches, shared by both throughputs.
+        return int(np.fromiter(self.sizes.values(), dtype=np.int64).sum())
 
     def _consensus_throughput(self):
         if not self.commits:
             return 0, 0, 0
-        start, end = min(self.proposals.values()), max(self.commits.values())
+        start = float(np.nanmin(self.proposal_times))
+        end = float(np.nanmax(self.commit_times))
         duration = end - start
-        bytes = sum(self.sizes.values())
+        bytes = self.sizes_sum
         bps = bytes / duration
         tps = bps / self.size[0]
         return tps, bps, duration
 
     def _consensus_latency(self):
-        latency = [c - self.proposals[d] for d, c in self.commits.items()]
-        return mean(latency) if latency else 0
+        latency = self.commit_times - self.proposal_times
+        latency = latency[~np.isnan(latency)]
+        return float(latency.mean()) if latency.size else 0
 
     def _end_to_end_throughput(self):
         if not self.commits:
             return 0, 0, 0
-        start, end = min(self.start), max(self.commits.values())
+        start, end = min(self.start), float(np.nanmax(self.commit_times))
         duration = end - start
-        bytes = sum(self.sizes.values())
+        bytes = self.sizes_sum
         bps = bytes / duration
         tps = bps / self.size[0]
         return tps, bps, duration
 
     def _end_to_end_latency(self):
+        if not self.commits:
+            return 0
         latency = []
         for sent, received in zip(self.sent_samples, self.received_samples):
-            for tx_id, batch_id in received.items():
-                if batch_id in self.commits:
-                    assert tx_id in sent  # We receive txs that we sent.
-                    start = sent[tx_id]
-                    end = self.commits[batch_id]
-                    latency += [end-start]
-        return mean(latency) if latency else 0
+            # Look up the commit time of each sample's batch through the
+            # digest index; unknown or uncommitted batches yield NaN.
+            ids = np.fromiter(
+                (self.digest_ids.get(d, -1) for d in received.values()),
+                dtype=np.intp, count=len(received))
+            end = np.where(ids >= 0, self.commit_times[ids], np.nan)
+            committed = ~np.isnan(end)
+            tx_ids = np.fromiter(
+                received.keys(), dtype=np.int64, count=len(received))
+            # We receive txs that we sent.
+            start = np.fromiter(
+                (sent[x] for x in tx_ids[committed].tolist()),
+                dtype=np.float64, count=int(committed.sum()))
+            latency += [end[committed] - start]
+        latency = np.concatenate(latency)
+        return float(latency.mean()) if latency.size else 0
 
     def result(self):
         header_num_of_batches_threshold = self.configs[0]['header_num_of_batches_threshold']
@@ -264,17 +374,17 @@ class LogParser:
 
         # TODO: support primary and worker on different processes, and fail on
         # empty log entries.
-        batch_creation_latency = mean(
+        batch_creation_latency = _mean(
             self.batch_creation_latencies.values()) * 1000 if self.batch_creation_latencies else -1
-        header_creation_latency = mean(
+        header_creation_latency = _mean(
             self.header_creation_latencies.values()) * 1000 if self.header_creation_latencies else -1
-        batch_to_header_latency = mean(
+        batch_to_header_latency = _mean(
             self.batch_to_header_latencies.values()) * 1000 if self.batch_to_header_latencies else -1
-        header_to_cert_latency = mean(
+        header_to_cert_latency = _mean(
             self.header_to_cert_latencies.values()) * 1000 if self.header_to_cert_latencies else -1
-        cert_commit_latency = mean(
+        cert_commit_latency = _mean(
             self.cert_commit_latencies.values()) * 1000 if self.cert_commit_latencies else -1
-        request_vote_outbound_latency = mean(
+        request_vote_outbound_latency = _mean(
             self.request_vote_outbound_latencies) if self.request_vote_outbound_latencies else -1
 
         return (
@@ -328,18 +438,10 @@ class LogParser:
     def process(cls, directory, faults=0):
         assert isinstance(directory, str)
 
-        clients = []
-        for filename in sorted(glob(join(directory, 'client-*.log'))):
-            with open(filename, 'r') as f:
-                clients += [f.read()]
-        primaries = []
-        for filename in sorted(glob(join(directory, 'primary-*.log'))):
-            with open(filename, 'r') as f:
-                primaries += [f.read()]
-        workers = []
-        for filename in sorted(glob(join(directory, 'worker-*.log'))):
-            with open(filename, 'r') as f:
-                workers += [f.read()]
+        # Only the filenames are sent to the pool; each worker maps its log.
+        clients = sorted(glob(join(directory, 'client-*.log')))
+        primaries = sorted(glob(join(directory, 'primary-*.log')))
+        workers = sorted(glob(join(directory, 'worker-*.log')))
 
         return cls(clients, primaries, workers, faults=faults)
 
@@ -358,18 +460,15 @@ class LogGrpcParser:
             raise ParseError(f'Failed to parse nodes\' logs: {e}')
         self.grpc_ports = results
 
-    def _parse_primaries(self, log):
-        port = search(
-            r'Consensus API gRPC Server listening on /ip4/.+/tcp/(.+)/http', log).group(1)
-        return port
+    def _parse_primaries(self, filename):
+        with _map_log(filename) as log:
+            port = _GRPC_PORT_RE.search(log).group(1)
+            return port.decode()
 
     @classmethod
     def process(cls, directory, faults=0):
         assert isinstance(directory, str)
 
-        primaries = []
-        for filename in sorted(glob(join(directory, 'primary-*.log'))):
-            with open(filename, 'r') as f:
-                primaries += [f.read()]
+        primaries = sorted(glob(join(directory, 'primary-*.log')))
 
         return cls(primaries, faults=faults)